@@ -1,16 +1,21 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import argparse
 import json
 import os
 import re
 import sys
 from dataclasses import dataclass
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, List, Optional
 
 import requests
 
+from instrumentation import Instrumentation, profiled
+from leaderboard_db import append_pending, commit_ops, make_award_op
+
 
 POINTS_RE = re.compile(r"^Points:\s*(\d+)\s*$", re.IGNORECASE)
 AWARD_RE = re.compile(r"(?mi)^\s*/award\s+(@[A-Za-z0-9-]+)\s*$")
@@ -22,6 +27,7 @@ class Context:
     token: str
     event_path: Path
     db_path: Path
+    pending_path: Optional[Path]
 
 
 def gh(session: requests.Session, method: str, url: str, **kwargs):
@@ -68,36 +74,6 @@ def has_award_permission(session: requests.Session, repo: str, actor: str) -> bo
         return False
 
 
-def load_db(path: Path) -> Dict[str, int]:
-    if not path.exists():
-        return {}
-    raw = json.loads(path.read_text(encoding="utf-8") or "{}")
-    if isinstance(raw, dict) and "users" in raw and isinstance(raw["users"], dict):
-        return {k: int(v.get("points", 0)) for k, v in raw["users"].items() if isinstance(v, dict)}
-    if isinstance(raw, dict):
-        return {k: int(v) for k, v in raw.items()}
-    return {}
-
-
-def save_db(path: Path, totals: Dict[str, int]) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    # 兼容新结构：写成 {"users": {"u": {"points": N}}, "awards": {...}}
-    raw = {}
-    if path.exists():
-        try:
-            raw = json.loads(path.read_text(encoding="utf-8") or "{}")
-        except json.JSONDecodeError:
-            raw = {}
-    awards = raw.get("awards") if isinstance(raw, dict) else None
-    if not isinstance(awards, dict):
-        awards = {}
-    out = {
-        "users": {u: {"points": int(p)} for u, p in totals.items()},
-        "awards": awards,
-    }
-    path.write_text(json.dumps(out, ensure_ascii=False, indent=2, sort_keys=True) + "\n", encoding="utf-8")
-
-
 def get_issue_points(session: requests.Session, repo: str, issue_number: int) -> int:
     issue = gh(session, "GET", f"https://api.github.com/repos/{repo}/issues/{issue_number}")
     pts = parse_points_from_labels(issue.get("labels") or [])
@@ -114,24 +90,39 @@ def post_comment(session: requests.Session, repo: str, issue_number: int, body:
 
 
 def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--profile", metavar="PATH", help="用 cProfile 采样并将 stats 写入 PATH")
+    args = ap.parse_args()
+
+    inst = Instrumentation("award_points")
+    with profiled(args.profile):
+        try:
+            return run(inst)
+        finally:
+            inst.emit()
+
+
+def run(inst: Instrumentation) -> int:
     repo = os.getenv("GITHUB_REPOSITORY", "")
     token = os.getenv("GITHUB_TOKEN", "")
     event_path = Path(os.getenv("GITHUB_EVENT_PATH", ""))
     db_path = Path(os.getenv("LEADERBOARD_DB", "data/leaderboard.json"))
+    pending = os.getenv("PENDING_OPS", "")
 
     if not repo or not token or not event_path.exists():
         print("Missing required GitHub Actions context envs", file=sys.stderr)
         return 2
 
-    ctx = Context(repo=repo, token=token, event_path=event_path, db_path=db_path)
+    ctx = Context(
+        repo=repo,
+        token=token,
+        event_path=event_path,
+        db_path=db_path,
+        pending_path=Path(pending) if pending else None,
+    )
 
     event = json.loads(ctx.event_path.read_text(encoding="utf-8"))
-    comment_body = ((event.get("comment") or {}).get("body")) or ""
-    actor = ((event.get("comment") or {}).get("user") or {}).get("login") or os.getenv("GITHUB_ACTOR", "")
-    issue_number = int(((event.get("issue") or {}).get("number")) or 0)
-
-    targets = extract_award_targets(comment_body)
-    if not targets:
+    if not extract_award_targets(((event.get("comment") or {}).get("body")) or ""):
         print("No /award targets found; skipping")
         return 0
 
@@ -144,36 +135,91 @@ def main() -> int:
             "User-Agent": "embodia-hackerhouse-award-bot",
         }
     )
+    inst.attach(session)
+
+    award_from_comment(session, ctx.repo, event, ctx.db_path, ctx.pending_path, inst)
+    return 0
+
+
+def award_from_comment(
+    session: requests.Session,
+    repo: str,
+    event: dict,
+    db_path: Path,
+    pending_path: Optional[Path],
+    inst: Instrumentation,
+    can_award: Optional[Callable[[str], bool]] = None,
+    issue_points: Optional[Callable[[int], int]] = None,
+) -> List[dict]:
+    """处理一条 issue_comment 事件中的 /award；返回实际生效的 award 操作。
+
+    can_award / issue_points 可替换为带缓存的实现（webhook 常驻服务使用），
+    默认直接调用 GitHub API。
+    """
+    if can_award is None:
+        can_award = lambda actor: has_award_permission(session, repo, actor)  # noqa: E731
+    if issue_points is None:
+        issue_points = lambda number: get_issue_points(session, repo, number)  # noqa: E731
+
+    comment_body = ((event.get("comment") or {}).get("body")) or ""
+    actor = ((event.get("comment") or {}).get("user") or {}).get("login") or os.getenv("GITHUB_ACTOR", "")
+    issue_number = int(((event.get("issue") or {}).get("number")) or 0)
+    comment_id = int(((event.get("comment") or {}).get("id")) or 0)
+
+    targets = extract_award_targets(comment_body)
+    if not targets:
+        print("No /award targets found; skipping")
+        return []
 
-    if not actor or not has_award_permission(session, ctx.repo, actor):
+    with inst.phase("fetch"):
+        allowed = bool(actor) and can_award(actor)
+    if not allowed:
         print(f"Actor @{actor} has no permission to award", file=sys.stderr)
         # 不自动删评论，直接回帖提示
         if issue_number:
-            post_comment(session, ctx.repo, issue_number, f"⛔️ @{actor} 无权发放积分（需要 write/maintain/admin 权限）。")
-        return 0
+            post_comment(session, repo, issue_number, f"⛔️ @{actor} 无权发放积分（需要 write/maintain/admin 权限）。")
+        return []
 
-    points = get_issue_points(session, ctx.repo, issue_number)
+    with inst.phase("fetch"):
+        points = issue_points(issue_number)
     if points <= 0:
         post_comment(
             session,
-            ctx.repo,
+            repo,
             issue_number,
             "⛔️ 本 Issue 未设置 `Points: XX` 标签，无法计分。请先添加分值标签再执行 `/award @user`。",
         )
-        return 0
-
-    totals = load_db(ctx.db_path)
-    for u in targets:
-        totals[u] = int(totals.get(u, 0)) + int(points)
-
-    save_db(ctx.db_path, totals)
+        return []
+
+    # 以「评论 + 用户」作为幂等 key：同一条评论重复投递 / 重放不会重复加分
+    ts = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+    ops = [
+        make_award_op(
+            f"comment:{comment_id}:user:{u}" if comment_id else f"issue:{issue_number}:user:{u}",
+            u,
+            points,
+            repo=repo,
+            issue=issue_number,
+            comment=comment_id,
+            actor=actor,
+            ts=ts,
+        )
+        for u in targets
+    ]
+    with inst.phase("db_save"):
+        if pending_path is not None:
+            append_pending(pending_path, ops)
+        applied = commit_ops(db_path, ops)
+    if not applied:
+        print("Award already applied; skipping")
+        return []
 
     # 友好回帖：一次 /award 支持多个用户
-    who = ", ".join([f"@{u}" for u in targets])
-    post_comment(session, ctx.repo, issue_number, f"✅ 已为 {who} 发放 **{points}** 积分。排行榜将自动刷新。")
-    return 0
+    who = ", ".join([f"@{op['user']}" for op in applied])
+    with inst.phase("publish"):
+        post_comment(session, repo, issue_number, f"✅ 已为 {who} 发放 **{points}** 积分。排行榜将自动刷新。")
+    return applied
 
 
 if __name__ == "__main__":
     raise SystemExit(main())
-
@@ -1,28 +1,25 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import argparse
 import json
 import os
 import re
 import sys
-from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, List, Optional
 
 import requests
 
+from instrumentation import Instrumentation, profiled
+from leaderboard_db import append_pending, commit_ops, make_award_op
+
 
 POINTS_RE = re.compile(r"^Points:\s*(\d+)\s*$", re.IGNORECASE)
 LINKED_ISSUE_RE = re.compile(r"(?im)\b(?:fixes|closes|resolves)\s+#(\d+)\b")
 
 
-@dataclass(frozen=True)
-class Db:
-    users: Dict[str, int]
-    awards: Dict[str, dict]
-
-
 def gh(session: requests.Session, method: str, url: str, **kwargs):
     r = session.request(method, url, timeout=60, **kwargs)
     r.raise_for_status()
@@ -54,30 +51,6 @@ def extract_linked_issues(pr_body: str) -> List[int]:
     return out
 
 
-def load_db(path: Path) -> Db:
-    if not path.exists():
-        return Db(users={}, awards={})
-    raw = json.loads(path.read_text(encoding="utf-8") or "{}")
-    if isinstance(raw, dict) and "users" in raw and isinstance(raw["users"], dict):
-        users = {k: int(v.get("points", 0)) for k, v in raw["users"].items() if isinstance(v, dict)}
-        awards = raw.get("awards") if isinstance(raw.get("awards"), dict) else {}
-        return Db(users=users, awards=awards)
-    if isinstance(raw, dict):
-        # 兼容旧 KV
-        users = {k: int(v) for k, v in raw.items() if isinstance(v, (int, float, str))}
-        return Db(users=users, awards={})
-    return Db(users={}, awards={})
-
-
-def save_db(path: Path, db: Db) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    out = {
-        "users": {u: {"points": int(p)} for u, p in db.users.items()},
-        "awards": db.awards,
-    }
-    path.write_text(json.dumps(out, ensure_ascii=False, indent=2, sort_keys=True) + "\n", encoding="utf-8")
-
-
 def get_issue_points(session: requests.Session, repo: str, issue_number: int) -> int:
     issue = gh(session, "GET", f"https://api.github.com/repos/{repo}/issues/{issue_number}")
     pts = parse_points_from_labels(issue.get("labels") or [])
@@ -95,16 +68,62 @@ def post_pr_comment(session: requests.Session, repo: str, pr_number: int, body:
 
 
 def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--profile", metavar="PATH", help="用 cProfile 采样并将 stats 写入 PATH")
+    args = ap.parse_args()
+
+    inst = Instrumentation("award_points_from_pr")
+    with profiled(args.profile):
+        try:
+            return run(inst)
+        finally:
+            inst.emit()
+
+
+def run(inst: Instrumentation) -> int:
     repo = os.getenv("GITHUB_REPOSITORY", "")
     token = os.getenv("GITHUB_TOKEN", "")
     event_path = Path(os.getenv("GITHUB_EVENT_PATH", ""))
     db_path = Path(os.getenv("LEADERBOARD_DB", "data/leaderboard.json"))
+    pending = os.getenv("PENDING_OPS", "")
 
     if not repo or not token or not event_path.exists():
         print("Missing required GitHub Actions context envs", file=sys.stderr)
         return 2
 
     event = json.loads(event_path.read_text(encoding="utf-8"))
+
+    session = requests.Session()
+    session.headers.update(
+        {
+            "Accept": "application/vnd.github+json",
+            "Authorization": f"Bearer {token}",
+            "X-GitHub-Api-Version": "2022-11-28",
+            "User-Agent": "embodia-hackerhouse-pr-award-bot",
+        }
+    )
+    inst.attach(session)
+
+    award_from_pr(session, repo, event, db_path, Path(pending) if pending else None, inst)
+    return 0
+
+
+def award_from_pr(
+    session: requests.Session,
+    repo: str,
+    event: dict,
+    db_path: Path,
+    pending_path: Optional[Path],
+    inst: Instrumentation,
+    issue_points: Optional[Callable[[int], int]] = None,
+) -> List[dict]:
+    """处理一条 pull_request closed 事件；返回实际生效的 award 操作。
+
+    issue_points 可替换为带缓存的实现（webhook 常驻服务使用），默认直接调用 GitHub API。
+    """
+    if issue_points is None:
+        issue_points = lambda number: get_issue_points(session, repo, number)  # noqa: E731
+
     pr = event.get("pull_request") or {}
     pr_number = int(pr.get("number") or 0)
     merged = bool(pr.get("merged"))
@@ -113,62 +132,54 @@ def main() -> int:
 
     if not merged:
         print("PR not merged; skipping")
-        return 0
+        return []
     if not pr_author:
         print("Missing PR author; skipping", file=sys.stderr)
-        return 0
+        return []
 
     issue_numbers = extract_linked_issues(pr_body)
     if not issue_numbers:
         # 不报错：只是提醒维护者没写 Fixes #xx
-        return 0
+        return []
 
-    session = requests.Session()
-    session.headers.update(
-        {
-            "Accept": "application/vnd.github+json",
-            "Authorization": f"Bearer {token}",
-            "X-GitHub-Api-Version": "2022-11-28",
-            "User-Agent": "embodia-hackerhouse-pr-award-bot",
-        }
-    )
-
-    db = load_db(db_path)
-    total_added = 0
-    applied: List[Tuple[int, int]] = []  # (issue, points)
+    ops: List[dict] = []
     skipped: List[int] = []
 
     for issue_number in issue_numbers:
-        pts = get_issue_points(session, repo, issue_number)
+        with inst.phase("fetch"):
+            pts = issue_points(issue_number)
         if pts <= 0:
             skipped.append(issue_number)
             continue
-        award_key = f"pr:{pr_number}:issue:{issue_number}:user:{pr_author}"
-        if award_key in db.awards:
-            continue
-        db.users[pr_author] = int(db.users.get(pr_author, 0)) + int(pts)
-        db.awards[award_key] = {
-            "repo": repo,
-            "pr": pr_number,
-            "issue": issue_number,
-            "user": pr_author,
-            "points": int(pts),
-            "ts": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC"),
-        }
-        total_added += int(pts)
-        applied.append((issue_number, int(pts)))
-
+        ops.append(
+            make_award_op(
+                f"pr:{pr_number}:issue:{issue_number}:user:{pr_author}",
+                pr_author,
+                pts,
+                repo=repo,
+                pr=pr_number,
+                issue=issue_number,
+                ts=datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC"),
+            )
+        )
+
+    if not ops:
+        return []
+
+    with inst.phase("db_save"):
+        if pending_path is not None:
+            append_pending(pending_path, ops)
+        applied = commit_ops(db_path, ops)
+    total_added = sum(int(op["points"]) for op in applied)
     if total_added <= 0:
-        return 0
-
-    save_db(db_path, db)
+        return []
 
     # 可选：在 PR 下回帖提示（便于追踪）
-    details = ", ".join([f"#{i} (+{p})" for i, p in applied])
-    post_pr_comment(session, repo, pr_number, f"✅ 已为 @{pr_author} 发放 **{total_added}** 积分（关联 {details}）。排行榜将自动刷新。")
-    return 0
+    details = ", ".join([f"#{op['issue']} (+{op['points']})" for op in applied])
+    with inst.phase("publish"):
+        post_pr_comment(session, repo, pr_number, f"✅ 已为 @{pr_author} 发放 **{total_added}** 积分（关联 {details}）。排行榜将自动刷新。")
+    return applied
 
 
 if __name__ == "__main__":
     raise SystemExit(main())
-
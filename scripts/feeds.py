@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+
+# 机器可读的 JSON Feed（供外部看板 / Bot 直接读取，无需抓 README 或调用 GitHub API）
+# 结构变更时递增版本号，消费方按 version 判断是否兼容
+FEED_VERSION = 1
+
+
+def content_etag(payload: Any) -> str:
+    """对规范化 JSON 取 sha256，作为 ETag 风格的内容指纹"""
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def load_feed(path: Path) -> Optional[dict]:
+    if not path.exists():
+        return None
+    try:
+        raw = json.loads(path.read_text(encoding="utf-8") or "{}")
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(raw, dict) or raw.get("version") != FEED_VERSION:
+        return None
+    return raw
+
+
+def write_feed(path: Path, kind: str, data: dict, etag_basis: Any = None) -> bool:
+    """仅当内容指纹变化时写入 Feed；返回是否写入。
+
+    etag_basis 默认为 data 本身；若 data 中包含相对上一版计算的派生字段（如 delta），
+    应传入不含派生字段的内容，避免每次运行都因派生字段变化而重写。
+    """
+    etag = content_etag(data if etag_basis is None else etag_basis)
+    prev = load_feed(path)
+    if prev is not None and prev.get("kind") == kind and prev.get("etag") == etag:
+        return False
+
+    out = {
+        "version": FEED_VERSION,
+        "kind": kind,
+        "etag": etag,
+        "generated_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "data": data,
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(out, ensure_ascii=False, separators=(",", ":"), sort_keys=True) + "\n", encoding="utf-8")
+    return True
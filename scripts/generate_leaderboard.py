@@ -2,15 +2,27 @@
 from __future__ import annotations
 
 import argparse
+import json
 import os
 import re
 import sys
 from dataclasses import dataclass
 from datetime import datetime, timezone
+from pathlib import Path
 from typing import Dict, Iterable, List, Optional, Tuple
 
 import requests
 
+try:
+    import numpy as np
+except ImportError:  # 可选依赖：未安装时使用纯 Python 聚合
+    np = None
+
+from feeds import load_feed, write_feed
+from instrumentation import Instrumentation, profiled
+from leaderboard_db import load_ranked
+from multirepo import fetch_per_repo, list_org_repos, parse_repo_args, per_repo_cache_path
+
 
 LEADERBOARD_START = "<!-- LEADERBOARD:START -->"
 LEADERBOARD_END = "<!-- LEADERBOARD:END -->"
@@ -26,12 +38,6 @@ class IssueScore:
     assignees: Tuple[str, ...]
 
 
-def gh_get(session: requests.Session, url: str, params: Optional[dict] = None) -> dict:
-    r = session.get(url, params=params, timeout=60)
-    r.raise_for_status()
-    return r.json()
-
-
 def parse_points_from_labels(labels: Iterable[dict]) -> Optional[int]:
     for lb in labels:
         name = (lb.get("name") or "").strip()
@@ -91,6 +97,52 @@ def compute_totals(scores: List[IssueScore]) -> Dict[str, int]:
     return totals
 
 
+def compute_totals_vectorized(scores: List[IssueScore]) -> Dict[str, int]:
+    """与 compute_totals 结果完全一致的数组化实现（需要 NumPy）。
+
+    用户名先映射为整数 id；分值与完成人数平铺为数组，向量化地做向下取整均分，
+    再按用户 id 以 int64 归约（不用 bincount：其 weights 按 float64 累加，超过 2**53 会丢精度）。
+    """
+    user_ids: Dict[str, int] = {}
+    names: List[str] = []
+    points: List[int] = []
+    counts: List[int] = []
+    flat_users: List[int] = []
+    for s in scores:
+        if not s.assignees:
+            continue
+        points.append(s.points)
+        counts.append(len(s.assignees))
+        for u in s.assignees:
+            uid = user_ids.get(u)
+            if uid is None:
+                uid = user_ids[u] = len(names)
+                names.append(u)
+            flat_users.append(uid)
+    if not points:
+        return {}
+
+    counts_arr = np.asarray(counts, dtype=np.int64)
+    per = np.asarray(points, dtype=np.int64) // counts_arr
+    per_flat = np.repeat(per, counts_arr)
+    users_arr = np.asarray(flat_users, dtype=np.int64)
+    keep = per_flat > 0
+    sums = np.zeros(len(names), dtype=np.int64)
+    np.add.at(sums, users_arr[keep], per_flat[keep])
+    return {names[i]: v for i, v in enumerate(sums.tolist()) if v > 0}
+
+
+def aggregate_totals(scores: List[IssueScore], vectorize: bool = False) -> Dict[str, int]:
+    """vectorize=True 且安装了 NumPy 时走数组化路径，否则回退到 compute_totals。
+
+    注意：输入为 IssueScore 对象时，构建数组本身需要逐条访问属性，
+    在 CPython 上未必快于字典累加，因此默认关闭，按需通过 --vectorize 开启。
+    """
+    if vectorize and np is not None:
+        return compute_totals_vectorized(scores)
+    return compute_totals(scores)
+
+
 def medal_for_points(points: int) -> str:
     if points >= 1500:
         return "🌟 架构师"
@@ -103,9 +155,15 @@ def medal_for_points(points: int) -> str:
     return ""
 
 
-def render_table(totals: Dict[str, int], top_n: int = 20) -> str:
-    items = sorted(totals.items(), key=lambda kv: (-kv[1], kv[0].lower()))
-    items = items[:top_n]
+def rank_totals(totals: Dict[str, int]) -> List[Tuple[str, int]]:
+    return sorted(totals.items(), key=lambda kv: (-kv[1], kv[0].lower()))
+
+
+def render_table(
+    ranked: List[Tuple[str, int]], top_n: int = 20, per_repo: Optional[Dict[str, Dict[str, int]]] = None
+) -> str:
+    """ranked 为已按排行榜顺序排好的 (用户, 积分)，只用到前 top_n 项"""
+    items = ranked[:top_n]
 
     lines: List[str] = []
     lines.append("## 🏆 开发者荣誉榜（自动更新）")
@@ -118,11 +176,56 @@ def render_table(totals: Dict[str, int], top_n: int = 20) -> str:
     if not items:
         lines.append("| - | - | 0 | |")
     lines.append("")
+    # 多仓库：在总榜之后附上各仓库的分榜
+    for repo, repo_totals in (per_repo or {}).items():
+        lines.append(f"### 📦 {repo}")
+        lines.append("")
+        lines.append("| 排名 | 开发者 | 积分 (XP) |")
+        lines.append("| :--- | :--- | ---: |")
+        repo_items = rank_totals(repo_totals)[:top_n]
+        for idx, (user, pts) in enumerate(repo_items, start=1):
+            lines.append(f"| {idx} | @{user} | {pts} |")
+        if not repo_items:
+            lines.append("| - | - | 0 |")
+        lines.append("")
     ts = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
     lines.append(f"> 最近更新：{ts}（由 GitHub Actions 自动生成）")
     return "\n".join(lines)
 
 
+def build_leaderboard_feed(
+    ranked: List[Tuple[str, int]], prev: Optional[dict], per_repo: Optional[Dict[str, Dict[str, int]]] = None
+) -> Tuple[dict, dict]:
+    """生成排行榜 Feed 数据；delta / rank_delta 相对上一次发布的 Feed 计算。
+
+    返回 (data, etag_basis)：etag_basis 即去掉 delta / rank_delta 后的 data。
+    """
+    prev_entries = ((prev or {}).get("data") or {}).get("users") or []
+    prev_by_user = {e.get("user"): e for e in prev_entries if isinstance(e, dict)}
+
+    users: List[dict] = []
+    for idx, (user, pts) in enumerate(ranked, start=1):
+        old = prev_by_user.get(user)
+        users.append(
+            {
+                "rank": idx,
+                "user": user,
+                "points": pts,
+                "medal": medal_for_points(pts),
+                # 新上榜用户：delta 为全部积分，rank_delta 为 null
+                "delta": pts - int(old.get("points", 0)) if old else pts,
+                "rank_delta": int(old.get("rank", 0)) - idx if old else None,
+            }
+        )
+    data = {"total_users": len(users), "users": users}
+    if per_repo:
+        data["repos"] = {repo: [{"user": u, "points": p} for u, p in rank_totals(t)] for repo, t in per_repo.items()}
+
+    derived = ("delta", "rank_delta")
+    basis = dict(data, users=[{k: v for k, v in e.items() if k not in derived} for e in users])
+    return data, basis
+
+
 def replace_between_markers(text: str, replacement: str) -> str:
     if LEADERBOARD_START not in text or LEADERBOARD_END not in text:
         raise RuntimeError("README missing leaderboard markers")
@@ -132,17 +235,55 @@ def replace_between_markers(text: str, replacement: str) -> str:
     return f"{pre}{LEADERBOARD_START}\n{replacement}\n{LEADERBOARD_END}{post}"
 
 
-def fetch_closed_issues_with_labels(session: requests.Session, repo: str) -> List[dict]:
+def slim_issue(it: dict) -> dict:
+    """只保留 extract_issue_scores 用到的字段，控制缓存体积"""
+    out = {
+        "number": it.get("number"),
+        "title": it.get("title"),
+        "state": it.get("state"),
+        "labels": [{"name": lb.get("name")} for lb in (it.get("labels") or [])],
+        "assignees": [{"login": a.get("login")} for a in (it.get("assignees") or [])],
+        "user": {"login": (it.get("user") or {}).get("login")},
+    }
+    if "pull_request" in it:
+        out["pull_request"] = {}
+    return out
+
+
+def fetch_closed_issues_with_labels(session: requests.Session, repo: str, cache_path: Optional[Path] = None) -> List[dict]:
     # Use REST issues list API; labels are included, and it's available by default with GITHUB_TOKEN.
     # We fetch ALL closed issues and filter client-side by Points label for simplicity.
+    # With cache_path, each page is revalidated via If-None-Match; a 304 reuses the cached page
+    # and does not count against the rate limit.
+    cached_pages: List[dict] = []
+    if cache_path is not None and cache_path.exists():
+        try:
+            raw = json.loads(cache_path.read_text(encoding="utf-8") or "{}")
+            if raw.get("repo") == repo and isinstance(raw.get("pages"), list):
+                cached_pages = raw["pages"]
+        except (json.JSONDecodeError, AttributeError):
+            cached_pages = []
+
     issues: List[dict] = []
+    pages: List[dict] = []
     page = 1
     while True:
-        batch = gh_get(
-            session,
+        cached = cached_pages[page - 1] if page <= len(cached_pages) else None
+        headers = {"If-None-Match": cached["etag"]} if cached and cached.get("etag") else {}
+        r = session.get(
             f"https://api.github.com/repos/{repo}/issues",
             params={"state": "closed", "per_page": 100, "page": page},
+            headers=headers,
+            timeout=60,
         )
+        if r.status_code == 304 and cached is not None:
+            batch = cached.get("items") or []
+            pages.append(cached)
+        else:
+            r.raise_for_status()
+            batch = r.json()
+            if isinstance(batch, list):
+                pages.append({"etag": r.headers.get("ETag"), "items": [slim_issue(it) for it in batch]})
         if not isinstance(batch, list) or not batch:
             break
         issues.extend(batch)
@@ -152,71 +293,112 @@ def fetch_closed_issues_with_labels(session: requests.Session, repo: str) -> Lis
         if page > 50:
             # Safety guard: prevents runaway API calls on huge repos for MVP stage
             break
+
+    if cache_path is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_path.write_text(json.dumps({"repo": repo, "pages": pages}, ensure_ascii=False, separators=(",", ":")) + "\n", encoding="utf-8")
     return issues
 
 
+def new_session(token: str, inst: Instrumentation) -> requests.Session:
+    session = requests.Session()
+    session.headers.update(
+        {
+            "Accept": "application/vnd.github+json",
+            "Authorization": f"Bearer {token}",
+            "X-GitHub-Api-Version": "2022-11-28",
+            "User-Agent": "embodia-hackerhouse-leaderboard",
+        }
+    )
+    inst.attach(session)
+    return session
+
+
 def main() -> int:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--repo", required=False, help="OWNER/REPO（仅当从 GitHub 拉取 issues 时需要）")
+    ap.add_argument("--repo", action="append", help="OWNER/REPO（仅当从 GitHub 拉取 issues 时需要；可重复或逗号分隔以聚合多个仓库）")
+    ap.add_argument("--org", required=False, help="聚合该组织下所有未归档仓库（与 --repo 合并）")
     ap.add_argument("--token", required=False, default=os.getenv("GITHUB_TOKEN"), help="GitHub token（或 env GITHUB_TOKEN）")
     ap.add_argument("--from-json", default="data/leaderboard.json", help="从 JSON 数据库读取积分（推荐）")
     ap.add_argument("--from-github", action="store_true", help="从 GitHub issues 计算积分（旧模式，不推荐）")
     ap.add_argument("--readme", default="README.md", help="Path to README to update")
     ap.add_argument("--top", type=int, default=20, help="Top N users")
+    ap.add_argument("--feed", default="data/feeds/leaderboard.json", help="排行榜 JSON Feed 输出路径（传空字符串关闭）")
+    ap.add_argument("--cache", default=".cache/closed_issues.json", help="closed issues 条件请求缓存路径（多仓库时按仓库拆分；传空字符串关闭）")
+    ap.add_argument("--vectorize", action="store_true", help="--from-github 时使用 NumPy 数组化聚合（未安装 NumPy 时自动回退）")
+    ap.add_argument("--profile", metavar="PATH", help="用 cProfile 采样并将 stats 写入 PATH")
     args = ap.parse_args()
 
-    totals: Dict[str, int]
+    inst = Instrumentation("generate_leaderboard")
+    with profiled(args.profile):
+        try:
+            return run(args, inst)
+        finally:
+            inst.emit()
+
+
+def run(args: argparse.Namespace, inst: Instrumentation) -> int:
+    ranked: List[Tuple[str, int]]
+    per_repo: Optional[Dict[str, Dict[str, int]]] = None
     if not args.from_github:
-        import json
-
-        with open(args.from_json, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        # 支持两种结构：
-        # 1) {"userA": 50, "userB": 10}
-        # 2) {"users": {"userA": {"points": 50}}, "awards": {...}}
-        if isinstance(data, dict) and "users" in data and isinstance(data["users"], dict):
-            totals = {
-                k: int(v.get("points", 0))
-                for k, v in data["users"].items()
-                if isinstance(v, dict)
-            }
-        elif isinstance(data, dict):
-            totals = {k: int(v) for k, v in data.items()}
-        else:
-            totals = {}
+        with inst.phase("db_load"):
+            # 支持两种结构（由 leaderboard_db 统一解析；有新鲜的二进制快照时直接 mmap 读取）：
+            # 1) {"userA": 50, "userB": 10}
+            # 2) {"users": {"userA": {"points": 50}}, "awards": {...}}
+            # 快照已按排名存放：不输出 Feed 时只需读取前 top 名
+            ranked = load_ranked(Path(args.from_json), top_n=None if args.feed else args.top)
     else:
-        if not args.repo:
-            print("Missing --repo when using --from-github", file=sys.stderr)
+        if not args.repo and not args.org:
+            print("Missing --repo (or --org) when using --from-github", file=sys.stderr)
             return 2
         if not args.token:
             print("Missing token: pass --token or set GITHUB_TOKEN", file=sys.stderr)
             return 2
 
-        session = requests.Session()
-        session.headers.update(
-            {
-                "Accept": "application/vnd.github+json",
-                "Authorization": f"Bearer {args.token}",
-                "X-GitHub-Api-Version": "2022-11-28",
-                "User-Agent": "embodia-hackerhouse-leaderboard",
-            }
-        )
-
-        raw_issues = fetch_closed_issues_with_labels(session, args.repo)
-        scores = extract_issue_scores(raw_issues)
-        totals = compute_totals(scores)
-
-    rendered = render_table(totals, top_n=args.top)
-
-    with open(args.readme, "r", encoding="utf-8") as f:
-        readme = f.read()
-    updated = replace_between_markers(readme, rendered)
-    if updated != readme:
-        with open(args.readme, "w", encoding="utf-8") as f:
-            f.write(updated)
+        try:
+            repos = parse_repo_args(args.repo)
+        except ValueError as e:
+            print(str(e), file=sys.stderr)
+            return 2
+        if args.org:
+            with inst.phase("fetch"):
+                repos += [r for r in list_org_repos(new_session(args.token, inst), args.org) if r not in repos]
+        multi = len(repos) > 1
+
+        def fetch(repo: str) -> List[dict]:
+            # requests.Session 并非线程安全：每个仓库使用独立 session
+            cache_path = per_repo_cache_path(Path(args.cache), repo, multi) if args.cache else None
+            return fetch_closed_issues_with_labels(new_session(args.token, inst), repo, cache_path=cache_path)
+
+        with inst.phase("fetch"):
+            raw_by_repo = fetch_per_repo(repos, fetch)
+        with inst.phase("classify"):
+            scores_by_repo = {repo: extract_issue_scores(raw) for repo, raw in raw_by_repo.items()}
+            totals = aggregate_totals([s for scores in scores_by_repo.values() for s in scores], vectorize=args.vectorize)
+            if multi:
+                per_repo = {repo: aggregate_totals(scores, vectorize=args.vectorize) for repo, scores in scores_by_repo.items()}
+            ranked = rank_totals(totals)
+
+    with inst.phase("render"):
+        rendered = render_table(ranked, top_n=args.top, per_repo=per_repo)
+
+    with inst.phase("readme_io"):
+        with open(args.readme, "r", encoding="utf-8") as f:
+            readme = f.read()
+        updated = replace_between_markers(readme, rendered)
+        if updated != readme:
+            with open(args.readme, "w", encoding="utf-8") as f:
+                f.write(updated)
+
+    if args.feed:
+        with inst.phase("feed"):
+            feed_path = Path(args.feed)
+            data, basis = build_leaderboard_feed(ranked, load_feed(feed_path), per_repo=per_repo)
+            # 指纹不含 delta 字段：榜单内容未变化时不重写，保留上一次的 delta
+            if write_feed(feed_path, "leaderboard", data, etag_basis=basis):
+                print(f"Updated leaderboard feed: {feed_path}")
     return 0
 
 
 if __name__ == "__main__":
     raise SystemExit(main())
-
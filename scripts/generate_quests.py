@@ -2,15 +2,22 @@
 from __future__ import annotations
 
 import argparse
+import json
 import os
 import re
 import sys
-from dataclasses import dataclass
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, replace
 from datetime import datetime, timezone
-from typing import Dict, List, Optional
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
 
 import requests
 
+from feeds import load_feed, write_feed
+from instrumentation import Instrumentation, profiled
+from multirepo import fetch_per_repo, list_org_repos, parse_repo_args, per_repo_cache_path
+
 
 QUESTS_START = "<!-- QUESTS:START -->"
 QUESTS_END = "<!-- QUESTS:END -->"
@@ -18,6 +25,9 @@ QUESTS_END = "<!-- QUESTS:END -->"
 POINTS_RE = re.compile(r"^Points:\s*(\d+)\s*$", re.IGNORECASE)
 QUEST_TYPE_RE = re.compile(r"^Quest:\s*(.+)$", re.IGNORECASE)
 
+# 分类缓存格式 / 识别规则版本
+CLASSIFIER_VERSION = 2
+
 
 @dataclass(frozen=True)
 class Quest:
@@ -27,6 +37,7 @@ class Quest:
     points: int
     url: str
     state: str
+    repo: str = ""
 
 
 def gh_get(session: requests.Session, url: str, params: Optional[dict] = None) -> dict:
@@ -56,8 +67,7 @@ def parse_quest_type_from_labels(labels: List[dict]) -> Optional[str]:
     return None
 
 
-def fetch_open_quests(session: requests.Session, repo: str, debug: bool = False) -> List[Quest]:
-    """获取所有开放的 Quest Issue"""
+def list_open_issues(session: requests.Session, repo: str) -> List[dict]:
     issues: List[dict] = []
     page = 1
     while True:
@@ -74,98 +84,204 @@ def fetch_open_quests(session: requests.Session, repo: str, debug: bool = False)
         page += 1
         if page > 50:
             break
+    return issues
+
+
+class QuestCache:
+    """持久化的分类结果缓存，键为 (issue number, updated_at)。
+
+    Issue 未变化时直接复用上次的 Quest 记录；本次列表中不再出现的 Issue（已关闭或删除）
+    在保存时淘汰，超出容量时按最近使用顺序（LRU）淘汰。
+    """
+
+    def __init__(self, path: Path, max_entries: int = 5000) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._seen: Set[str] = set()
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            raw = json.loads(self.path.read_text(encoding="utf-8") or "{}")
+        except json.JSONDecodeError:
+            return
+        # 识别规则变化时递增 CLASSIFIER_VERSION，旧缓存整体失效
+        if not isinstance(raw, dict) or raw.get("version") != CLASSIFIER_VERSION:
+            self._dirty = True
+            return
+        entries = raw.get("entries")
+        if isinstance(entries, list):
+            for e in entries:
+                if isinstance(e, dict) and "number" in e:
+                    self._entries[str(e["number"])] = e
+
+    def lookup(self, issue: dict) -> Optional[Tuple[Optional[Quest], str]]:
+        key = str(issue.get("number", 0))
+        self._seen.add(key)
+        entry = self._entries.get(key)
+        if entry is None or entry.get("updated_at") != issue.get("updated_at"):
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        quest = entry.get("quest")
+        return (Quest(**quest) if isinstance(quest, dict) else None), str(entry.get("reason") or "")
+
+    def store(self, issue: dict, quest: Optional[Quest], reason: str) -> None:
+        key = str(issue.get("number", 0))
+        self._seen.add(key)
+        self._entries[key] = {
+            "number": int(issue.get("number", 0)),
+            "updated_at": issue.get("updated_at"),
+            "quest": asdict(quest) if quest is not None else None,
+            "reason": reason,
+        }
+        self._entries.move_to_end(key)
+        self._dirty = True
+
+    def save(self) -> None:
+        for key in [k for k in self._entries if k not in self._seen]:
+            del self._entries[key]
+            self._dirty = True
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._dirty = True
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        out = {"version": CLASSIFIER_VERSION, "entries": list(self._entries.values())}
+        self.path.write_text(json.dumps(out, ensure_ascii=False, separators=(",", ":")) + "\n", encoding="utf-8")
+        self._dirty = False
+
+
+def repo_from_issue(issue: dict) -> str:
+    """从 repository_url（https://api.github.com/repos/OWNER/REPO）取出 OWNER/REPO"""
+    url = str(issue.get("repository_url") or "")
+    marker = "/repos/"
+    return url.split(marker, 1)[1] if marker in url else ""
+
+
+def classify_issue(issue: dict, debug: bool = False) -> Tuple[Optional[Quest], str]:
+    """识别单个 Issue；返回 (Quest, "") 或 (None, 跳过原因)"""
+    # 跳过 PR
+    if "pull_request" in issue:
+        return None, "pr"
+    
+    # 检查是否有 Quest 类型标签
+    labels = issue.get("labels", [])
+    label_names = [lb.get("name", "") for lb in labels]
+    issue_title = str(issue.get("title") or "").strip()
+    
+    if debug:
+        issue_num = issue.get("number", 0)
+        print(f"Issue #{issue_num}: {issue_title}", file=sys.stderr)
+        print(f"  Labels: {', '.join(label_names)}", file=sys.stderr)
+    
+    quest_type = parse_quest_type_from_labels(labels)
+    
+    # 如果没有 Quest 类型标签，但标题包含 [Quest] 或使用了 Quest 模板，尝试识别
+    if not quest_type:
+        # 检查标题是否以 [Quest] 开头（表示使用了 Quest 模板）
+        if issue_title.startswith("[Quest]") or issue_title.startswith("[任务]"):
+            # 尝试从标题中提取类型，或使用默认类型
+            title_lower = issue_title.lower()
+            if "learning" in title_lower or "学习" in title_lower:
+                quest_type = "Learning"
+            elif "coding" in title_lower or "编程" in title_lower or "代码" in title_lower:
+                quest_type = "Coding"
+            elif "promotion" in title_lower or "推广" in title_lower:
+                quest_type = "Promotion"
+            else:
+                # 默认使用 Coding 类型
+                quest_type = "Coding"
+            
+            if debug:
+                print(f"  -> Detected Quest type from title: {quest_type}", file=sys.stderr)
+        else:
+            if debug:
+                print(f"  -> Skipped: No Quest type label and title doesn't match Quest pattern", file=sys.stderr)
+            return None, "no_quest_type"
+    
+    # 检查状态标签（可选，如果没有 Status: Open 标签也包含）
+    has_open_status = any(
+        (lb.get("name") or "").strip().lower() == "status: open"
+        for lb in labels
+    )
+    # 如果没有状态标签，默认认为是开放的
+    if not has_open_status and any(
+        (lb.get("name") or "").strip().lower().startswith("status:")
+        for lb in labels
+    ):
+        # 有其他状态标签但不是 Open，跳过
+        if debug:
+            print(f"  -> Skipped: Wrong status label", file=sys.stderr)
+        return None, "wrong_status"
+    
+    # 获取分值
+    points = parse_points_from_labels(labels)
+    if points is None:
+        points = 0
+    
+    if debug:
+        print(f"  -> Included: {quest_type}, {points} XP", file=sys.stderr)
+    
+    return (
+        Quest(
+            number=int(issue.get("number", 0)),
+            title=str(issue.get("title") or "").strip(),
+            quest_type=quest_type,
+            points=points,
+            url=str(issue.get("html_url", "")),
+            state=str(issue.get("state", "open")),
+            repo=repo_from_issue(issue),
+        ),
+        "",
+    )
 
+
+def classify_quests(issues: List[dict], debug: bool = False, cache: Optional[QuestCache] = None) -> List[Quest]:
+    """从 Issue 列表中识别开放的 Quest"""
     if debug:
         print(f"Fetched {len(issues)} open issues", file=sys.stderr)
 
     quests: List[Quest] = []
-    skipped_no_quest_type = 0
-    skipped_wrong_status = 0
-    skipped_pr = 0
+    skipped = {"pr": 0, "no_quest_type": 0, "wrong_status": 0}
     
     for issue in issues:
-        # 跳过 PR
-        if "pull_request" in issue:
-            skipped_pr += 1
-            continue
-        
-        # 检查是否有 Quest 类型标签
-        labels = issue.get("labels", [])
-        label_names = [lb.get("name", "") for lb in labels]
-        issue_title = str(issue.get("title") or "").strip()
-        
-        if debug:
-            issue_num = issue.get("number", 0)
-            print(f"Issue #{issue_num}: {issue_title}", file=sys.stderr)
-            print(f"  Labels: {', '.join(label_names)}", file=sys.stderr)
-        
-        quest_type = parse_quest_type_from_labels(labels)
-        
-        # 如果没有 Quest 类型标签，但标题包含 [Quest] 或使用了 Quest 模板，尝试识别
-        if not quest_type:
-            # 检查标题是否以 [Quest] 开头（表示使用了 Quest 模板）
-            if issue_title.startswith("[Quest]") or issue_title.startswith("[任务]"):
-                # 尝试从标题中提取类型，或使用默认类型
-                title_lower = issue_title.lower()
-                if "learning" in title_lower or "学习" in title_lower:
-                    quest_type = "Learning"
-                elif "coding" in title_lower or "编程" in title_lower or "代码" in title_lower:
-                    quest_type = "Coding"
-                elif "promotion" in title_lower or "推广" in title_lower:
-                    quest_type = "Promotion"
-                else:
-                    # 默认使用 Coding 类型
-                    quest_type = "Coding"
-                
-                if debug:
-                    print(f"  -> Detected Quest type from title: {quest_type}", file=sys.stderr)
-            else:
-                skipped_no_quest_type += 1
-                if debug:
-                    print(f"  -> Skipped: No Quest type label and title doesn't match Quest pattern", file=sys.stderr)
-                continue
-        
-        # 检查状态标签（可选，如果没有 Status: Open 标签也包含）
-        has_open_status = any(
-            (lb.get("name") or "").strip().lower() == "status: open"
-            for lb in labels
-        )
-        # 如果没有状态标签，默认认为是开放的
-        if not has_open_status and any(
-            (lb.get("name") or "").strip().lower().startswith("status:")
-            for lb in labels
-        ):
-            # 有其他状态标签但不是 Open，跳过
-            skipped_wrong_status += 1
+        cached = cache.lookup(issue) if cache is not None else None
+        if cached is not None:
+            quest, reason = cached
             if debug:
-                print(f"  -> Skipped: Wrong status label", file=sys.stderr)
+                print(f"Issue #{issue.get('number', 0)}: cache hit", file=sys.stderr)
+        else:
+            quest, reason = classify_issue(issue, debug=debug)
+            if cache is not None:
+                cache.store(issue, quest, reason)
+
+        if quest is None:
+            skipped[reason] = skipped.get(reason, 0) + 1
             continue
-        
-        # 获取分值
-        points = parse_points_from_labels(labels)
-        if points is None:
-            points = 0
-        
-        if debug:
-            print(f"  -> Included: {quest_type}, {points} XP", file=sys.stderr)
-        
-        quests.append(
-            Quest(
-                number=int(issue.get("number", 0)),
-                title=str(issue.get("title") or "").strip(),
-                quest_type=quest_type,
-                points=points,
-                url=str(issue.get("html_url", "")),
-                state=str(issue.get("state", "open")),
-            )
-        )
+        quests.append(quest)
     
     if debug:
-        print(f"Skipped: {skipped_pr} PRs, {skipped_no_quest_type} issues without Quest type, {skipped_wrong_status} issues with wrong status", file=sys.stderr)
+        print(f"Skipped: {skipped['pr']} PRs, {skipped['no_quest_type']} issues without Quest type, {skipped['wrong_status']} issues with wrong status", file=sys.stderr)
     
     return quests
 
 
+def fetch_open_quests(
+    session: requests.Session, repo: str, debug: bool = False, cache: Optional[QuestCache] = None
+) -> List[Quest]:
+    """获取所有开放的 Quest Issue"""
+    return classify_quests(list_open_issues(session, repo), debug=debug, cache=cache)
+
+
 def quest_type_display_name(quest_type: str) -> str:
     """将 Quest 类型转换为显示名称"""
     type_map = {
@@ -176,19 +292,10 @@ def quest_type_display_name(quest_type: str) -> str:
     return type_map.get(quest_type, quest_type)
 
 
-def render_quests_table(quests: List[Quest]) -> str:
-    """渲染任务表格"""
+def render_type_sections(quests: List[Quest], heading: str = "###") -> List[str]:
+    """按类型分组渲染任务表格"""
     lines: List[str] = []
-    lines.append("## 📋 任务展示界面（自动更新）")
-    lines.append("")
-    
-    if not quests:
-        lines.append("> 当前没有开放的任务，请稍后再来查看！")
-        lines.append("")
-        ts = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
-        lines.append(f"> 最近更新：{ts}（由 GitHub Actions 自动生成）")
-        return "\n".join(lines)
-    
+
     # 按类型分组
     quests_by_type: Dict[str, List[Quest]] = {}
     for quest in quests:
@@ -206,7 +313,7 @@ def render_quests_table(quests: List[Quest]) -> str:
         type_quests = quests_by_type[quest_type]
         type_display = quest_type_display_name(quest_type)
         
-        lines.append(f"### {type_display}")
+        lines.append(f"{heading} {type_display}")
         lines.append("")
         lines.append("| 任务 | 分值 | 链接 |")
         lines.append("| :--- | ---: | :--- |")
@@ -223,12 +330,99 @@ def render_quests_table(quests: List[Quest]) -> str:
             lines.append(f"| {title} | {quest.points} XP | [#{quest.number}]({quest.url}) |")
         
         lines.append("")
+    return lines
+
+
+def render_quests_table(quests: List[Quest]) -> str:
+    """渲染任务表格"""
+    lines: List[str] = []
+    lines.append("## 📋 任务展示界面（自动更新）")
+    lines.append("")
+    
+    if not quests:
+        lines.append("> 当前没有开放的任务，请稍后再来查看！")
+        lines.append("")
+        ts = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+        lines.append(f"> 最近更新：{ts}（由 GitHub Actions 自动生成）")
+        return "\n".join(lines)
+    
+    repos = sorted({q.repo for q in quests})
+    if len(repos) <= 1:
+        lines.extend(render_type_sections(quests))
+    else:
+        # 多仓库：先按仓库分组，再按类型分组
+        for repo in repos:
+            lines.append(f"### 📦 {repo or '-'}")
+            lines.append("")
+            lines.extend(render_type_sections([q for q in quests if q.repo == repo], heading="####"))
     
     ts = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
     lines.append(f"> 最近更新：{ts}（由 GitHub Actions 自动生成）")
     return "\n".join(lines)
 
 
+def build_quests_feed(quests: List[Quest]) -> dict:
+    """生成任务 Feed 数据（按仓库、Issue 编号排序，保证内容指纹稳定）"""
+    return {
+        "total_quests": len(quests),
+        "quests": [
+            {
+                "number": q.number,
+                "title": q.title,
+                "type": q.quest_type,
+                "points": q.points,
+                "url": q.url,
+                "repo": q.repo,
+            }
+            for q in sorted(quests, key=lambda q: (q.repo, q.number))
+        ],
+    }
+
+
+def load_quests_feed(path: Path) -> Optional[List[Quest]]:
+    """从已发布的任务 Feed 还原任务列表（事件模式下作为持久化的任务状态）"""
+    feed = load_feed(path)
+    if feed is None or feed.get("kind") != "quests":
+        return None
+    quests: List[Quest] = []
+    for q in (feed.get("data") or {}).get("quests") or []:
+        if not isinstance(q, dict):
+            continue
+        quests.append(
+            Quest(
+                number=int(q.get("number", 0)),
+                title=str(q.get("title") or ""),
+                quest_type=str(q.get("type") or ""),
+                points=int(q.get("points", 0)),
+                url=str(q.get("url") or ""),
+                state="open",
+                repo=str(q.get("repo") or ""),
+            )
+        )
+    return quests
+
+
+def apply_issue_event(quests: List[Quest], event: dict, debug: bool = False) -> List[Quest]:
+    """按 issues 事件载荷增量更新任务列表：只对变更的那一个 Issue 重新识别"""
+    issue = event.get("issue") or {}
+    number = int(issue.get("number") or 0)
+    repo = repo_from_issue(issue) or str((event.get("repository") or {}).get("full_name") or "")
+    # 旧版 Feed 中的任务没有 repo 字段，按编号匹配
+    rest = [q for q in quests if not (q.number == number and q.repo in (repo, ""))]
+
+    # 关闭 / 删除的 Issue 直接移除；其余按与 fetch_open_quests 相同的规则识别
+    if event.get("action") == "deleted" or (issue.get("state") or "open").lower() != "open":
+        if debug:
+            print(f"Issue #{number}: removed ({event.get('action')})", file=sys.stderr)
+        return rest
+    quest, _ = classify_issue(issue, debug=debug)
+    if quest is None:
+        return rest
+    if not quest.repo:
+        quest = replace(quest, repo=repo)
+    return rest + [quest]
+
+
 def replace_between_markers(text: str, replacement: str) -> str:
     if QUESTS_START not in text or QUESTS_END not in text:
         raise RuntimeError("README missing quests markers")
@@ -240,45 +434,127 @@ def replace_between_markers(text: str, replacement: str) -> str:
 
 def main() -> int:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--repo", required=True, help="OWNER/REPO（例如：owner/repo）")
+    ap.add_argument("--repo", action="append", help="OWNER/REPO（例如：owner/repo；可重复或逗号分隔以聚合多个仓库；--from-event 模式下可省略）")
+    ap.add_argument("--org", required=False, help="聚合该组织下所有未归档仓库（与 --repo 合并）")
     ap.add_argument("--token", required=False, default=os.getenv("GITHUB_TOKEN"), help="GitHub token（或 env GITHUB_TOKEN）")
     ap.add_argument("--readme", default="README.md", help="Path to README to update")
+    ap.add_argument("--feed", default="data/feeds/quests.json", help="任务 JSON Feed 输出路径（传空字符串关闭）")
+    ap.add_argument("--cache", default=".cache/quest_classification.json", help="分类缓存路径（多仓库时按仓库拆分；传空字符串关闭）")
+    ap.add_argument("--from-event", action="store_true", help="从 GITHUB_EVENT_PATH 的 issues 事件增量更新（不调用 GitHub API）")
     ap.add_argument("--debug", action="store_true", help="显示调试信息")
+    ap.add_argument("--profile", metavar="PATH", help="用 cProfile 采样并将 stats 写入 PATH")
     args = ap.parse_args()
 
-    if not args.token:
-        print("Missing token: pass --token or set GITHUB_TOKEN", file=sys.stderr)
-        return 2
+    inst = Instrumentation("generate_quests")
+    with profiled(args.profile):
+        try:
+            return run(args, inst)
+        finally:
+            inst.emit()
+
+
+def quests_from_event(args: argparse.Namespace) -> Optional[List[Quest]]:
+    """事件模式；缺少事件载荷或任务状态时返回 None，由调用方回退到全量拉取"""
+    event_path = Path(os.getenv("GITHUB_EVENT_PATH", ""))
+    if not os.getenv("GITHUB_EVENT_PATH") or not event_path.exists():
+        print("Missing GITHUB_EVENT_PATH; falling back to full listing", file=sys.stderr)
+        return None
+    event = json.loads(event_path.read_text(encoding="utf-8"))
+    if not isinstance(event.get("issue"), dict):
+        print("Event has no issue payload; falling back to full listing", file=sys.stderr)
+        return None
+    if "pull_request" in event["issue"]:
+        # 不是 issues 事件（例如 PR 上的评论）
+        print("Event issue is a pull request; falling back to full listing", file=sys.stderr)
+        return None
+    quests = load_quests_feed(Path(args.feed)) if args.feed else None
+    if quests is None:
+        print("No quest state feed found; falling back to full listing", file=sys.stderr)
+        return None
+    return apply_issue_event(quests, event, debug=args.debug)
 
+
+def new_session(token: str, inst: Instrumentation) -> requests.Session:
     session = requests.Session()
     session.headers.update(
         {
             "Accept": "application/vnd.github+json",
-            "Authorization": f"Bearer {args.token}",
+            "Authorization": f"Bearer {token}",
             "X-GitHub-Api-Version": "2022-11-28",
             "User-Agent": "embodia-hackerhouse-quests",
         }
     )
+    inst.attach(session)
+    return session
 
-    quests = fetch_open_quests(session, args.repo, debug=args.debug)
-    
+
+def run(args: argparse.Namespace, inst: Instrumentation) -> int:
+    if args.from_event:
+        with inst.phase("classify"):
+            quests = quests_from_event(args)
+        if quests is not None:
+            return publish(args, inst, quests)
+
+    if not args.repo and not args.org:
+        print("Missing --repo (or --org)", file=sys.stderr)
+        return 2
+    if not args.token:
+        print("Missing token: pass --token or set GITHUB_TOKEN", file=sys.stderr)
+        return 2
+
+    try:
+        repos = parse_repo_args(args.repo)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    if args.org:
+        with inst.phase("fetch"):
+            repos += [r for r in list_org_repos(new_session(args.token, inst), args.org) if r not in repos]
+    multi = len(repos) > 1
+
+    with inst.phase("fetch"):
+        # requests.Session 并非线程安全：每个仓库使用独立 session
+        issues_by_repo = fetch_per_repo(repos, lambda repo: list_open_issues(new_session(args.token, inst), repo))
+    quests: List[Quest] = []
+    with inst.phase("classify"):
+        for repo, issues in issues_by_repo.items():
+            cache = QuestCache(per_repo_cache_path(Path(args.cache), repo, multi)) if args.cache else None
+            repo_quests = classify_quests(issues, debug=args.debug, cache=cache)
+            quests.extend(q if q.repo else replace(q, repo=repo) for q in repo_quests)
+            if cache is not None:
+                cache.save()
+                inst.cache_hit(cache.hits)
+    return publish(args, inst, quests)
+
+
+def publish(args: argparse.Namespace, inst: Instrumentation, quests: List[Quest]) -> int:
     if args.debug:
         print(f"Found {len(quests)} quests", file=sys.stderr)
         for q in quests:
             print(f"  - #{q.number}: {q.title} ({q.quest_type}, {q.points} XP)", file=sys.stderr)
     
-    rendered = render_quests_table(quests)
+    with inst.phase("render"):
+        rendered = render_quests_table(quests)
 
-    with open(args.readme, "r", encoding="utf-8") as f:
-        readme = f.read()
-    
-    updated = replace_between_markers(readme, rendered)
-    if updated != readme:
-        with open(args.readme, "w", encoding="utf-8") as f:
-            f.write(updated)
-        print(f"Updated {len(quests)} quests in README.md")
-    else:
-        print("No changes to README.md")
+    with inst.phase("readme_io"):
+        with open(args.readme, "r", encoding="utf-8") as f:
+            readme = f.read()
+        
+        updated = replace_between_markers(readme, rendered)
+        if updated != readme:
+            with open(args.readme, "w", encoding="utf-8") as f:
+                f.write(updated)
+            print(f"Updated {len(quests)} quests in README.md")
+        else:
+            print("No changes to README.md")
+
+    if args.feed:
+        with inst.phase("feed"):
+            feed_path = Path(args.feed)
+            if write_feed(feed_path, "quests", build_quests_feed(quests)):
+                print(f"Updated quests feed: {feed_path}")
+            else:
+                print(f"No changes to {feed_path}")
     
     return 0
 
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import requests
+
+
+# 轻量级运行指标：按阶段（fetch / classify / render / db_load / db_save / readme_io ...）
+# 记录耗时、请求数、传输字节数、缓存命中，以及 GitHub API 剩余配额
+
+
+def _new_counters() -> Dict[str, float]:
+    return {"seconds": 0.0, "requests": 0, "bytes": 0, "cache_hits": 0}
+
+
+class Instrumentation:
+    def __init__(self, script: str) -> None:
+        self.script = script
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.totals = _new_counters()
+        self.rate_limit_remaining: Optional[int] = None
+        self._stack: List[str] = []
+        # 多仓库并发拉取时，response hook 会在工作线程中触发
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        with self._lock:
+            counters = self.phases.setdefault(name, _new_counters())
+        self._stack.append(name)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                counters["seconds"] += time.perf_counter() - t0
+            self._stack.pop()
+
+    def _bump(self, key: str, n: int) -> None:
+        with self._lock:
+            self.totals[key] += n
+            if self._stack:
+                self.phases[self._stack[-1]][key] += n
+
+    def cache_hit(self, n: int = 1) -> None:
+        self._bump("cache_hits", n)
+
+    def attach(self, session: requests.Session) -> None:
+        """挂到 session 的 response hook 上，统计所有经由该 session 的请求"""
+        session.hooks.setdefault("response", []).append(self._on_response)
+
+    def _on_response(self, r: requests.Response, *args, **kwargs) -> None:
+        self._bump("requests", 1)
+        # 非 stream 请求随后本就会读取完整 body，这里提前读取不会额外产生网络开销
+        self._bump("bytes", len(r.content or b""))
+        if r.status_code == 304:
+            self._bump("cache_hits", 1)
+        remaining = r.headers.get("X-RateLimit-Remaining")
+        if remaining is not None and remaining.isdigit():
+            value = int(remaining)
+            with self._lock:
+                if self.rate_limit_remaining is None or value < self.rate_limit_remaining:
+                    self.rate_limit_remaining = value
+
+    def report(self) -> dict:
+        def rounded(c: Dict[str, float]) -> dict:
+            return {k: (round(v, 4) if k == "seconds" else int(v)) for k, v in c.items()}
+
+        # 常驻服务中 /healthz 会与工作线程并发读取，先在锁内取快照
+        with self._lock:
+            totals = rounded(self.totals)
+            phases = {name: rounded(c) for name, c in self.phases.items()}
+        totals["seconds"] = round(time.perf_counter() - self._started, 4)
+        return {
+            "script": self.script,
+            "phases": phases,
+            "totals": totals,
+            "rate_limit_remaining": self.rate_limit_remaining,
+        }
+
+    def emit(self) -> None:
+        """输出 JSON 到 stderr；在 GitHub Actions 中额外追加到 Step Summary"""
+        report = self.report()
+        print(json.dumps(report, ensure_ascii=False, sort_keys=True), file=sys.stderr)
+
+        summary_path = os.getenv("GITHUB_STEP_SUMMARY")
+        if not summary_path:
+            return
+        lines: List[str] = []
+        lines.append(f"### ⏱️ `{self.script}` 运行指标")
+        lines.append("")
+        lines.append("| 阶段 | 耗时 (s) | 请求数 | 字节数 | 缓存命中 |")
+        lines.append("| :--- | ---: | ---: | ---: | ---: |")
+        for name, c in list(report["phases"].items()) + [("**合计**", report["totals"])]:
+            lines.append(f"| {name} | {c['seconds']:.3f} | {c['requests']} | {c['bytes']} | {c['cache_hits']} |")
+        lines.append("")
+        remaining = report["rate_limit_remaining"]
+        lines.append(f"> API 剩余配额：{remaining if remaining is not None else '-'}")
+        lines.append("")
+        with open(summary_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+@contextmanager
+def profiled(path: Optional[str], top: int = 25) -> Iterator[None]:
+    """--profile：用 cProfile 采样，stats 写入 path，并在 stderr 打印累计耗时 Top N"""
+    if not path:
+        yield
+        return
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        prof.dump_stats(path)
+        buf = io.StringIO()
+        pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(top)
+        print(buf.getvalue(), file=sys.stderr)
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台：退化为不加锁
+    fcntl = None  # type: ignore[assignment]
+
+
+# 积分数据库（data/leaderboard.json）的读写层。
+#
+# 写入以「操作」而非「快照」为单位：每次发放积分是一条带唯一 key 的 award 操作，
+# 按 key 幂等地应用到最新的数据库上。数据库带有 version，写入时校验读取时的 version，
+# 过期（期间被其他进程或 git 改写）则抛出 StaleVersionError，由调用方重读并重放操作。
+
+
+class StaleVersionError(RuntimeError):
+    pass
+
+
+@dataclass
+class Db:
+    users: Dict[str, int]
+    awards: Dict[str, dict]
+    version: int = 0
+
+
+def parse_db(raw: object) -> Db:
+    if isinstance(raw, dict) and "users" in raw and isinstance(raw["users"], dict):
+        users = {k: int(v.get("points", 0)) for k, v in raw["users"].items() if isinstance(v, dict)}
+        awards = raw.get("awards") if isinstance(raw.get("awards"), dict) else {}
+        version = raw.get("version") if isinstance(raw.get("version"), int) else 0
+        return Db(users=users, awards=awards, version=version)
+    if isinstance(raw, dict):
+        # 兼容旧 KV
+        users = {k: int(v) for k, v in raw.items() if isinstance(v, (int, float, str))}
+        return Db(users=users, awards={}, version=0)
+    return Db(users={}, awards={}, version=0)
+
+
+def load_db(path: Path) -> Db:
+    if not path.exists():
+        return Db(users={}, awards={}, version=0)
+    return parse_db(json.loads(path.read_text(encoding="utf-8") or "{}"))
+
+
+# 只读二进制快照（data/leaderboard.bin，与 JSON 同目录，不入库）：
+#   header | int32 points[n] | uint32 name_offsets[n + 1] | NUL 结尾的 utf-8 用户名
+# 用户按排行榜顺序（积分降序、用户名不区分大小写升序）存放，读取时 mmap，
+# 无需解析 JSON、也无需为每个用户构建 dict。header 记录生成时 JSON 的 inode、size、mtime_ns
+# 与 ctime_ns，全部与当前 JSON 一致才视为新鲜，否则回退到解析 JSON 并重写快照。
+# mtime 可以被 cp -p / rsync -t / touch -r 还原，ctime 与 inode 则无法由用户设置。
+SNAPSHOT_MAGIC = b"EHLB"
+SNAPSHOT_FORMAT = 2
+# magic, format, little_endian, json_ino, json_size, json_mtime_ns, json_ctime_ns, db_version, n, names_len
+SNAPSHOT_HEADER = struct.Struct("<4sBBxxQqqqqII")
+
+
+def snapshot_path(path: Path) -> Path:
+    return path.with_suffix(".bin")
+
+
+def _source_stamp(st: os.stat_result) -> Tuple[int, int, int, int]:
+    return st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns
+
+
+def write_snapshot(path: Path, users: Dict[str, int], version: int = 0, st: Optional[os.stat_result] = None) -> None:
+    """写快照；st 为读取 users 之前对 JSON 的 stat（默认现取）。失败时静默跳过（快照只是加速手段）"""
+    try:
+        if st is None:
+            st = path.stat()
+        ranked = sorted(users.items(), key=lambda kv: (-kv[1], kv[0].lower()))
+        points = array("i", (int(p) for _, p in ranked))
+        names = [u.encode("utf-8") + b"\0" for u, _ in ranked]
+        offsets = array("I", [0])
+        for n in names:
+            offsets.append(offsets[-1] + len(n))
+        blob = b"".join(names)
+        header = SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC,
+            SNAPSHOT_FORMAT,
+            1 if sys.byteorder == "little" else 0,
+            *_source_stamp(st),
+            version,
+            len(ranked),
+            len(blob),
+        )
+        out = snapshot_path(path)
+        # load_ranked 重建快照时不持有数据库锁：每个写入者使用独立的临时文件，互不截断
+        f = tempfile.NamedTemporaryFile(dir=out.parent, prefix=out.name + ".", suffix=".tmp", delete=False)
+        tmp = Path(f.name)
+        try:
+            with f:
+                f.write(header + points.tobytes() + offsets.tobytes() + blob)
+            os.replace(tmp, out)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+            raise
+    except (OSError, OverflowError):
+        pass
+
+
+class Snapshot:
+    """mmap 只读视图：points 为 int32 memoryview，用户名按需解码"""
+
+    def __init__(self, fh, mm: mmap.mmap, n: int, version: int) -> None:
+        self._fh = fh
+        self._mm = mm
+        self.version = version
+        base = SNAPSHOT_HEADER.size
+        self._buf = memoryview(mm)
+        self.points = self._buf[base : base + 4 * n].cast("i")
+        self._offsets = self._buf[base + 4 * n : base + 8 * n + 4].cast("I")
+        self._names_start = base + 8 * n + 4
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def name(self, i: int) -> str:
+        start = self._names_start + self._offsets[i]
+        end = self._names_start + self._offsets[i + 1] - 1
+        return bytes(self._buf[start:end]).decode("utf-8")
+
+    def ranked(self, top_n: Optional[int] = None) -> List[Tuple[str, int]]:
+        if top_n is not None and top_n < len(self):
+            return [(self.name(i), self.points[i]) for i in range(top_n)]
+        # 全量读取：一次性解码整块用户名再按 NUL 切分，比逐个解码快得多
+        names = bytes(self._buf[self._names_start :]).decode("utf-8").split("\0")
+        return list(zip(names, self.points.tolist()))
+
+    def close(self) -> None:
+        self.points.release()
+        self._offsets.release()
+        self._buf.release()
+        self._mm.close()
+        self._fh.close()
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def open_snapshot(path: Path) -> Optional[Snapshot]:
+    """快照存在且与 JSON 的 inode / size / mtime_ns / ctime_ns 一致时返回 mmap 视图，否则返回 None"""
+    bin_path = snapshot_path(path)
+    try:
+        st = path.stat()
+        fh = open(bin_path, "rb")
+    except OSError:
+        return None
+    try:
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        fh.close()
+        return None
+    try:
+        magic, fmt, little, ino, size, mtime_ns, ctime_ns, version, n, names_len = SNAPSHOT_HEADER.unpack_from(mm, 0)
+        fresh = (
+            magic == SNAPSHOT_MAGIC
+            and fmt == SNAPSHOT_FORMAT
+            and bool(little) == (sys.byteorder == "little")
+            and (ino, size, mtime_ns, ctime_ns) == _source_stamp(st)
+            and len(mm) == SNAPSHOT_HEADER.size + 8 * n + 4 + names_len
+        )
+    except struct.error:
+        fresh = False
+    if not fresh:
+        mm.close()
+        fh.close()
+        return None
+    return Snapshot(fh, mm, n, version)
+
+
+def load_ranked(path: Path, top_n: Optional[int] = None) -> List[Tuple[str, int]]:
+    """只读场景的积分加载：按排行榜顺序返回 (用户, 积分)；优先使用新鲜的快照"""
+    snap = open_snapshot(path)
+    if snap is not None:
+        with snap:
+            return snap.ranked(top_n)
+    try:
+        # 先 stat 再读取：读取期间 JSON 被改写时，快照记录的是旧 stat，下次会判为过期
+        st: Optional[os.stat_result] = path.stat()
+    except OSError:
+        st = None
+    db = load_db(path)
+    if st is not None:
+        write_snapshot(path, db.users, db.version, st=st)
+    ranked = sorted(db.users.items(), key=lambda kv: (-kv[1], kv[0].lower()))
+    return ranked if top_n is None else ranked[:top_n]
+
+
+def _disk_version(path: Path) -> int:
+    if not path.exists():
+        return 0
+    try:
+        return parse_db(json.loads(path.read_text(encoding="utf-8") or "{}")).version
+    except json.JSONDecodeError:
+        return -1
+
+
+@contextmanager
+def locked(path: Path) -> Iterator[None]:
+    """对数据库加独占文件锁（锁文件与数据库同目录）"""
+    if fcntl is None:
+        yield
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(path.name + ".lock"), "a+") as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+
+def save_db(path: Path, db: Db) -> Db:
+    """比较并交换：磁盘上的 version 必须仍等于 db.version，否则抛出 StaleVersionError"""
+    with locked(path):
+        current = _disk_version(path)
+        if current != db.version:
+            raise StaleVersionError(f"{path}: expected version {db.version}, found {current}")
+        out = {
+            "version": db.version + 1,
+            "users": {u: {"points": int(p)} for u, p in db.users.items()},
+            "awards": db.awards,
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(out, ensure_ascii=False, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        os.replace(tmp, path)
+        write_snapshot(path, db.users, db.version + 1)
+    return Db(users=db.users, awards=db.awards, version=db.version + 1)
+
+
+def make_award_op(key: str, user: str, points: int, **meta: object) -> dict:
+    return {"key": key, "user": user, "points": int(points), **meta}
+
+
+def apply_ops(db: Db, ops: List[dict]) -> List[dict]:
+    """按 key 幂等地应用 award 操作；返回本次实际生效的操作"""
+    applied: List[dict] = []
+    for op in ops:
+        key = op.get("key")
+        if not key or key in db.awards:
+            continue
+        user = str(op["user"])
+        db.users[user] = int(db.users.get(user, 0)) + int(op["points"])
+        db.awards[key] = {k: v for k, v in op.items() if k != "key"}
+        applied.append(op)
+    return applied
+
+
+def commit_ops(path: Path, ops: List[dict], retries: int = 5) -> List[dict]:
+    """读取最新数据库、应用操作并以 CAS 写回；version 过期时重读重放"""
+    for _ in range(retries):
+        db = load_db(path)
+        applied = apply_ops(db, ops)
+        if not applied:
+            return []
+        try:
+            save_db(path, db)
+            return applied
+        except StaleVersionError:
+            continue
+    raise StaleVersionError(f"{path}: gave up after {retries} stale retries")
+
+
+def load_pending(path: Path) -> List[dict]:
+    if not path.exists():
+        return []
+    raw = json.loads(path.read_text(encoding="utf-8") or "[]")
+    return [op for op in raw if isinstance(op, dict)] if isinstance(raw, list) else []
+
+
+def append_pending(path: Path, ops: List[dict]) -> None:
+    """记录待发布的操作：推送被拒绝时，在最新的远端数据库上重放"""
+    with locked(path):
+        pending = load_pending(path)
+        keys = {op.get("key") for op in pending}
+        pending.extend(op for op in ops if op.get("key") not in keys)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(pending, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+
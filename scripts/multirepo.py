@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar
+
+import requests
+
+
+# 一个黑客营赛季可能跨多个仓库：解析 --repo / --org，并按仓库并发拉取
+
+T = TypeVar("T")
+
+REPO_RE = re.compile(r"^[A-Za-z0-9_.-]+/[A-Za-z0-9_.-]+$")
+
+
+def parse_repo_args(values: Optional[Iterable[str]]) -> List[str]:
+    """支持重复传入 --repo，也支持逗号 / 空白分隔；去重但保序"""
+    out: List[str] = []
+    seen = set()
+    for v in values or []:
+        for repo in re.split(r"[,\s]+", v or ""):
+            repo = repo.strip()
+            if not repo or repo in seen:
+                continue
+            if not REPO_RE.match(repo):
+                raise ValueError(f"Invalid repo: {repo!r} (expected OWNER/REPO)")
+            seen.add(repo)
+            out.append(repo)
+    return out
+
+
+def list_org_repos(session: requests.Session, org: str) -> List[str]:
+    """列出组织下所有未归档的仓库"""
+    repos: List[str] = []
+    page = 1
+    while True:
+        r = session.get(
+            f"https://api.github.com/orgs/{org}/repos",
+            params={"type": "all", "per_page": 100, "page": page},
+            timeout=60,
+        )
+        r.raise_for_status()
+        batch = r.json()
+        if not isinstance(batch, list) or not batch:
+            break
+        repos.extend(str(it.get("full_name")) for it in batch if it.get("full_name") and not it.get("archived"))
+        if len(batch) < 100:
+            break
+        page += 1
+        if page > 50:
+            break
+    return repos
+
+
+def fetch_per_repo(repos: List[str], fetch: Callable[[str], T], max_workers: int = 8) -> Dict[str, T]:
+    """并发执行每个仓库的 fetch；总耗时接近最慢的单个仓库，而非所有仓库之和。
+
+    结果按 repos 的顺序返回；任一仓库失败时抛出其异常。
+    """
+    if len(repos) <= 1:
+        return {repo: fetch(repo) for repo in repos}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(repos))) as pool:
+        futures = {repo: pool.submit(fetch, repo) for repo in repos}
+        return {repo: futures[repo].result() for repo in repos}
+
+
+def per_repo_cache_path(base: Path, repo: str, multi: bool) -> Path:
+    """单仓库时沿用 base；多仓库时每个仓库一个缓存文件（owner__repo 作为后缀）"""
+    if not multi:
+        return base
+    return base.with_name(f"{base.stem}.{repo.replace('/', '__')}{base.suffix}")
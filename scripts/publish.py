@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import os
+import shlex
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from leaderboard_db import commit_ops, load_pending
+
+
+# 发布积分 / README 变更到远端分支。
+#
+# 多个 workflow（award-points / award-points-merge / update-quests）会同时运行。
+# 这里不做 rebase / merge：每次尝试都从远端最新提交出发，重放待发布的 award 操作
+# （按 key 幂等），重新渲染 README，再提交推送；推送被拒绝则退避后重试。
+
+
+def git(*args: str, check: bool = True) -> subprocess.CompletedProcess:
+    return subprocess.run(["git", *args], check=check, text=True, capture_output=True)
+
+
+def current_branch() -> str:
+    # pull_request 事件检出的是 refs/pull/N/merge（游离 HEAD），应推送到目标分支
+    base = os.getenv("GITHUB_BASE_REF", "")
+    if base:
+        return base
+    return git("rev-parse", "--abbrev-ref", "HEAD").stdout.strip()
+
+
+def publish(
+    branch: str,
+    message: str,
+    paths: List[str],
+    db_path: Path,
+    ops: List[dict],
+    render: Callable[[], None],
+    retries: int = 5,
+) -> bool:
+    """从远端最新提交出发：重放操作、渲染、提交并推送；推送被拒绝时退避重试"""
+    for attempt in range(1, retries + 1):
+        git("fetch", "origin", branch)
+        git("reset", "--hard", f"origin/{branch}")
+
+        if ops:
+            applied = commit_ops(db_path, ops)
+            print(f"[{attempt}] Replayed {len(applied)}/{len(ops)} award operation(s)")
+        render()
+
+        if not git("status", "--porcelain", "--", *paths).stdout.strip():
+            print("No changes to commit.")
+            return True
+
+        git("add", "--", *paths)
+        git("commit", "-m", message)
+        push = git("push", "origin", f"HEAD:{branch}", check=False)
+        if push.returncode == 0:
+            print(f"[{attempt}] Pushed to {branch}")
+            return True
+
+        print(f"[{attempt}] Push rejected; refetching and replaying\n{push.stderr}", file=sys.stderr)
+        time.sleep(min(2 ** attempt, 30))
+
+    print(f"Gave up after {retries} attempts", file=sys.stderr)
+    return False
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--message", required=True, help="提交信息")
+    ap.add_argument("--pending", default=os.getenv("PENDING_OPS", ""), help="待发布的 award 操作文件（或 env PENDING_OPS）")
+    ap.add_argument("--db", default=os.getenv("LEADERBOARD_DB", "data/leaderboard.json"), help="积分数据库路径")
+    ap.add_argument("--render", action="append", default=[], help="每次尝试时执行的渲染命令（可重复）")
+    ap.add_argument("--paths", nargs="+", default=["data", "README.md"], help="需要提交的路径")
+    ap.add_argument("--branch", default=None, help="推送目标分支（默认当前分支或 GITHUB_BASE_REF）")
+    ap.add_argument("--retries", type=int, default=5, help="推送被拒绝时的最大重试次数")
+    args = ap.parse_args()
+
+    def render() -> None:
+        for cmd in args.render:
+            subprocess.run(shlex.split(cmd), check=True)
+
+    ok = publish(
+        branch=args.branch or current_branch(),
+        message=args.message,
+        paths=args.paths,
+        db_path=Path(args.db),
+        ops=load_pending(Path(args.pending)) if args.pending else [],
+        render=render,
+        retries=args.retries,
+    )
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
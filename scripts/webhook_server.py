@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+import generate_leaderboard
+import generate_quests
+from award_points import award_from_comment, get_issue_points, has_award_permission, parse_points_from_labels
+from award_points_from_pr import award_from_pr
+from feeds import load_feed, write_feed
+from instrumentation import Instrumentation
+from leaderboard_db import load_pending, load_ranked
+from publish import current_branch, publish
+
+
+# 可选的常驻 webhook 服务：直接接收 GitHub webhook 投递，复用 award_points.py /
+# award_points_from_pr.py / generate_quests.py 的同一套计分与渲染逻辑。
+# 进程内常驻 HTTP session、Issue 索引（编号 -> 分值）与任务列表，并把多次变更
+# 合并成一次发布，避免每个事件都冷启动一个 GitHub Actions job。
+
+PERMISSION_TTL = 600
+# GitHub 单次 webhook 投递的 payload 上限为 25 MB
+MAX_BODY = 25 * 1024 * 1024
+
+
+def verify_signature(secret: str, body: bytes, header: str) -> bool:
+    """校验 X-Hub-Signature-256（sha256=<hex>）"""
+    if not header.startswith("sha256="):
+        return False
+    expected = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, header[len("sha256="):])
+
+
+class WebhookState:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.repo: str = args.repo
+        self.db_path = Path(args.db)
+        # 只有 --push 时才需要记录待重放的操作（发布成功后清空）；否则文件只增不减
+        self.pending_path = Path(args.pending) if args.push else None
+        self.inst = Instrumentation("webhook_server")
+
+        self.session = requests.Session()
+        self.session.headers.update(
+            {
+                "Accept": "application/vnd.github+json",
+                "Authorization": f"Bearer {args.token}",
+                "X-GitHub-Api-Version": "2022-11-28",
+                "User-Agent": "embodia-hackerhouse-webhook",
+            }
+        )
+        self.inst.attach(self.session)
+
+        # 事件处理与发布共用一把锁：发布时会 reset 工作区
+        self.lock = threading.RLock()
+        self.dirty = threading.Event()
+        self.issue_points: Dict[int, int] = {}
+        self.permissions: Dict[str, Tuple[bool, float]] = {}
+        self.deliveries: "OrderedDict[str, None]" = OrderedDict()
+        self.quests: List[generate_quests.Quest] = []
+        self.last_publish_at: Optional[str] = None
+        self.last_publish_error: Optional[str] = None
+
+    def warm_up(self) -> None:
+        """启动时全量拉取一次开放 Issue，建立 Issue 索引与任务列表"""
+        with self.lock:
+            issues = generate_quests.list_open_issues(self.session, self.repo)
+            for issue in issues:
+                self.index_issue(issue)
+            self.quests = generate_quests.classify_quests(issues)
+        print(f"Warmed up: {len(issues)} open issues, {len(self.quests)} quests", file=sys.stderr)
+
+    def index_issue(self, issue: dict) -> None:
+        number = int(issue.get("number") or 0)
+        if number:
+            self.issue_points[number] = int(parse_points_from_labels(issue.get("labels") or []) or 0)
+
+    def cached_issue_points(self, number: int) -> int:
+        if number not in self.issue_points:
+            self.issue_points[number] = get_issue_points(self.session, self.repo, number)
+        return self.issue_points[number]
+
+    def cached_can_award(self, actor: str) -> bool:
+        hit = self.permissions.get(actor)
+        if hit is not None and time.monotonic() - hit[1] < PERMISSION_TTL:
+            return hit[0]
+        allowed = has_award_permission(self.session, self.repo, actor)
+        self.permissions[actor] = (allowed, time.monotonic())
+        return allowed
+
+    def seen_delivery(self, delivery: str) -> bool:
+        """GitHub 可能重复投递；按 X-GitHub-Delivery 去重"""
+        if not delivery:
+            return False
+        with self.lock:
+            if delivery in self.deliveries:
+                return True
+            self.deliveries[delivery] = None
+            while len(self.deliveries) > 1000:
+                self.deliveries.popitem(last=False)
+        return False
+
+    def handle(self, event_name: str, event: dict) -> None:
+        if ((event.get("repository") or {}).get("full_name") or self.repo) != self.repo:
+            return
+        with self.lock:
+            if event_name == "issue_comment" and event.get("action") == "created":
+                # 与 award-points workflow 一致：PR 上的评论同样处理 /award
+                self.index_issue(event.get("issue") or {})
+                applied = award_from_comment(
+                    self.session,
+                    self.repo,
+                    event,
+                    self.db_path,
+                    self.pending_path,
+                    self.inst,
+                    can_award=self.cached_can_award,
+                    issue_points=self.cached_issue_points,
+                )
+                if applied:
+                    self.dirty.set()
+            elif event_name == "pull_request" and event.get("action") == "closed":
+                applied = award_from_pr(
+                    self.session,
+                    self.repo,
+                    event,
+                    self.db_path,
+                    self.pending_path,
+                    self.inst,
+                    issue_points=self.cached_issue_points,
+                )
+                if applied:
+                    self.dirty.set()
+            elif event_name == "issues":
+                issue = event.get("issue") or {}
+                self.index_issue(issue)
+                self.quests = generate_quests.apply_issue_event(self.quests, event)
+                self.dirty.set()
+
+    def render(self) -> None:
+        """进程内渲染 README 与 JSON Feed（与两个 generate_* 脚本输出一致）"""
+        ranked = load_ranked(self.db_path)
+        readme_path = Path(self.args.readme)
+        readme = readme_path.read_text(encoding="utf-8")
+        updated = generate_leaderboard.replace_between_markers(
+            readme, generate_leaderboard.render_table(ranked, top_n=self.args.top)
+        )
+        updated = generate_quests.replace_between_markers(updated, generate_quests.render_quests_table(self.quests))
+        if updated != readme:
+            readme_path.write_text(updated, encoding="utf-8")
+
+        leaderboard_feed = Path(self.args.leaderboard_feed)
+        data, basis = generate_leaderboard.build_leaderboard_feed(ranked, load_feed(leaderboard_feed))
+        write_feed(leaderboard_feed, "leaderboard", data, etag_basis=basis)
+        write_feed(Path(self.args.quests_feed), "quests", generate_quests.build_quests_feed(self.quests))
+
+    def publish_once(self) -> bool:
+        if self.pending_path is None:
+            self.render()
+            return True
+        ok = publish(
+            branch=self.args.branch or current_branch(),
+            message="chore: update leaderboard (webhook)",
+            paths=["data", "README.md"],
+            db_path=self.db_path,
+            ops=load_pending(self.pending_path),
+            render=self.render,
+        )
+        if ok:
+            # 已推送的操作不再需要重放；失败时保留，下一批继续重试
+            self.pending_path.unlink(missing_ok=True)
+        return ok
+
+    def publish_loop(self) -> None:
+        """变更到达后再等待 batch 秒，把期间的所有变更合并成一次发布"""
+        while True:
+            self.dirty.wait()
+            time.sleep(self.args.batch)
+            with self.lock:
+                self.dirty.clear()
+                try:
+                    with self.inst.phase("publish"):
+                        ok = self.publish_once()
+                    error = None if ok else "push rejected; gave up after retries"
+                except Exception as e:  # 渲染 / git / CAS 失败都不应终止发布线程
+                    error = repr(e)
+                self.last_publish_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+                self.last_publish_error = error
+                if error is not None:
+                    print(f"Publish failed: {error}", file=sys.stderr)
+                    # 保留待发布的变更，下一批重试
+                    self.dirty.set()
+
+
+def make_handler(state: WebhookState, secret: str, jobs: "queue.Queue[Tuple[str, dict]]"):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code: int, payload: dict) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            if self.path != "/healthz":
+                self._reply(404, {"error": "not found"})
+                return
+            ok = state.last_publish_error is None
+            self._reply(
+                200 if ok else 503,
+                {
+                    "ok": ok,
+                    "queued": jobs.qsize(),
+                    "last_publish_at": state.last_publish_at,
+                    "last_publish_error": state.last_publish_error,
+                    "metrics": state.inst.report(),
+                },
+            )
+
+        def do_POST(self) -> None:
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                self._reply(400, {"error": "invalid Content-Length"})
+                return
+            if length > MAX_BODY:
+                self._reply(413, {"error": "payload too large"})
+                return
+            body = self.rfile.read(length)
+            if not verify_signature(secret, body, self.headers.get("X-Hub-Signature-256", "")):
+                self._reply(401, {"error": "bad signature"})
+                return
+            event_name = self.headers.get("X-GitHub-Event", "")
+            if event_name == "ping":
+                self._reply(200, {"ok": True})
+                return
+            if state.seen_delivery(self.headers.get("X-GitHub-Delivery", "")):
+                self._reply(200, {"ok": True, "duplicate": True})
+                return
+            try:
+                event = json.loads(body.decode("utf-8") or "{}")
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                self._reply(400, {"error": "invalid json"})
+                return
+            # 先应答（GitHub 要求 10 秒内响应），再由单个工作线程按顺序处理
+            jobs.put((event_name, event))
+            self._reply(202, {"ok": True})
+
+        def log_message(self, fmt: str, *args) -> None:
+            print(f"{self.address_string()} - {fmt % args}", file=sys.stderr)
+
+    return Handler
+
+
+def worker(state: WebhookState, jobs: "queue.Queue[Tuple[str, dict]]") -> None:
+    while True:
+        event_name, event = jobs.get()
+        try:
+            state.handle(event_name, event)
+        except Exception as e:  # 单个事件失败不应拖垮常驻服务
+            print(f"Failed to handle {event_name}: {e!r}", file=sys.stderr)
+        finally:
+            jobs.task_done()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="常驻 webhook 服务：接收 GitHub webhook 并发放积分、刷新任务列表")
+    ap.add_argument("--repo", default=os.getenv("GITHUB_REPOSITORY"), help="OWNER/REPO（或 env GITHUB_REPOSITORY）")
+    ap.add_argument("--token", default=os.getenv("GITHUB_TOKEN"), help="GitHub token（或 env GITHUB_TOKEN）")
+    ap.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET"), help="Webhook secret（或 env WEBHOOK_SECRET）")
+    ap.add_argument("--host", default="127.0.0.1", help="监听地址")
+    ap.add_argument("--port", type=int, default=8080, help="监听端口")
+    ap.add_argument("--db", default=os.getenv("LEADERBOARD_DB", "data/leaderboard.json"), help="积分数据库路径")
+    ap.add_argument("--pending", default=".cache/webhook_pending_ops.json", help="待发布的 award 操作文件（仅 --push 时使用）")
+    ap.add_argument("--readme", default="README.md", help="Path to README to update")
+    ap.add_argument("--top", type=int, default=20, help="Top N users")
+    ap.add_argument("--leaderboard-feed", default="data/feeds/leaderboard.json", help="排行榜 JSON Feed 路径")
+    ap.add_argument("--quests-feed", default="data/feeds/quests.json", help="任务 JSON Feed 路径")
+    ap.add_argument("--batch", type=float, default=10.0, help="合并发布的等待秒数")
+    ap.add_argument("--push", action="store_true", help="发布时提交并推送到远端（否则只更新本地文件）")
+    ap.add_argument("--branch", default=None, help="推送目标分支（默认当前分支）")
+    args = ap.parse_args()
+
+    if not args.repo or not args.token:
+        print("Missing --repo / --token", file=sys.stderr)
+        return 2
+    if not args.secret:
+        print("Missing webhook secret: pass --secret or set WEBHOOK_SECRET", file=sys.stderr)
+        return 2
+
+    state = WebhookState(args)
+    state.warm_up()
+
+    jobs: "queue.Queue[Tuple[str, dict]]" = queue.Queue()
+    threading.Thread(target=worker, args=(state, jobs), daemon=True).start()
+    threading.Thread(target=state.publish_loop, daemon=True).start()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state, args.secret, jobs))
+    print(f"Listening on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())